@@ -1,12 +1,12 @@
 import os
 import asyncio
-import json
+import hashlib
 import logging
 import unicodedata
-import random
 import re
+from collections import OrderedDict, defaultdict
 from datetime import datetime
-from typing import List, Set, Dict, Optional
+from typing import List, Set, Dict, Optional, Tuple
 
 from fastapi import FastAPI, WebSocket, Request, Form, Depends, HTTPException, status
 from fastapi.templating import Jinja2Templates
@@ -14,6 +14,8 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import APIKeyCookie
 from dotenv import load_dotenv
 import aiohttp
+import orjson
+from aiolimiter import AsyncLimiter
 from openai import AsyncOpenAI
 
 # --- Configurações ---
@@ -25,10 +27,21 @@ DASHBOARD_TOKEN = os.getenv("DASHBOARD_TOKEN")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+POLL_MIN_INTERVAL = 2
+POLL_MAX_INTERVAL = 30
+
+# --- Tabelas de Severidade / Parsing ---
+_SEV_ICONS = {'Info': 'ℹ️', 'Aviso': '⚠️', 'Média': '🟠', 'Alta': '🔥', 'Crítica': '☠️'}
+_SEV_MAP = {'1': 'Info', '2': 'Aviso', '3': 'Média', '4': 'Alta', '5': 'Crítica'}
+_TG_TEMPLATE = "<b>{icon} {sev} | {host}</b>\n<code>{problem}</code>\n\n🤖 <b>Análise IA:</b>\n{summary}\n\n🚀 <b>Ação:</b>\n<pre>{action}</pre>\n<span class=\"tg-spoiler\">{tags}</span>"
+_AI_ANALYSIS_RE = re.compile(r'"analysis"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_ACK_RE = re.compile(r'^IA:\s*(.*?)\s*(?:\|\s*CMD:\s*(.*?)\s*)?$', re.DOTALL)
+
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("AIOPS")
@@ -40,125 +53,246 @@ aclient = AsyncOpenAI(api_key=OPENAI_API_KEY)
 # --- WebSocket Manager ---
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
+        self._last_hash: Optional[bytes] = None
+        self._snapshot: Optional[bytes] = None
+        self._rows: Dict[str, dict] = {}
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
+        if self._snapshot: await websocket.send_bytes(self._snapshot)
+    def diff(self, dash: dict) -> Optional[bytes]:
+        # Só transmite quando o painel muda, e apenas o delta por id
+        payload = orjson.dumps(dash, option=orjson.OPT_NON_STR_KEYS)
+        h = hashlib.blake2b(payload, digest_size=16).digest()
+        if h == self._last_hash: return None
+        self._last_hash = h
+        rows = {r['id']: r for r in dash['data']}
+        prev = self._rows
+        diff = {
+            "stats": dash['stats'],
+            "added": [r for i, r in rows.items() if i not in prev],
+            "removed": [i for i in prev if i not in rows],
+            "updated": [r for i, r in rows.items() if i in prev and prev[i] != r]
+        }
+        self._rows, self._snapshot = rows, payload
+        return orjson.dumps(diff, option=orjson.OPT_NON_STR_KEYS)
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-    async def broadcast(self, message: str):
-        for connection in self.active_connections[:]:
-            try:
-                await connection.send_text(message)
-            except:
-                self.disconnect(connection)
+        self.active_connections.discard(websocket)
+    async def broadcast(self, message: bytes):
+        # Envio concorrente: um cliente lento não segura os demais
+        connections = list(self.active_connections)
+        results = await asyncio.gather(*(c.send_bytes(message) for c in connections), return_exceptions=True)
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception): self.disconnect(connection)
 
 manager = ConnectionManager()
 
+# --- Cache LRU (capacidade fixa) ---
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, object]" = OrderedDict()
+    def __contains__(self, key): return key in self._data
+    def __len__(self): return len(self._data)
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize: self._data.popitem(last=False)
+    def _has(self, key): return key in self._data
+    def _get(self, key, default=None):
+        if key not in self._data: return default
+        self._data.move_to_end(key)
+        return self._data[key]
+    get = _get
+    def add(self, key): self[key] = None
+    def discard(self, key): self._data.pop(key, None)
+    def snapshot(self): return dict(self._data)
+    def retain(self, keys):
+        for key in [k for k in self._data if k not in keys]: del self._data[key]
+
+# --- Controle de Admissão (pipelines de IA simultâneos) ---
+class Admission:
+    def __init__(self, cmax: int):
+        self.active = 0
+        self.cmax = cmax
+        self.cond = asyncio.Condition()
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < self.cmax)
+            self.active += 1
+    async def release(self):
+        async with self.cond:
+            self.active -= 1
+            self.cond.notify(1)
+    async def resize(self, cmax: int):
+        async with self.cond:
+            self.cmax = cmax
+            self.cond.notify_all()
+
 # --- ESTADO GLOBAL ---
 zabbix_auth_token = None
-processing_events: Set[str] = set()
-handled_events: Set[str] = set()
-ai_memory_cache: Dict[str, dict] = {} 
+processing_events = LRUCache(4096)
+handled_events = LRUCache(4096)
+ai_memory_cache = LRUCache(512)  # Podado aos triggers ativos a cada poll (process_queue)
+ai_result_cache = LRUCache(256)  # Análises por conteúdo (problema + host + tags)
 total_tokens_used = 0
+ai_admission = Admission(AI_MAX_CONCURRENCY)
+zabbix_ack_queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue()
+
+# Telegram: limite global do bot (30 msg/s) e por chat (1 msg/s)
+tg_limiter = AsyncLimiter(max_rate=25, time_period=1)
+tg_chat_limiters: Dict[str, AsyncLimiter] = defaultdict(lambda: AsyncLimiter(1, 1))
+tg_retry_until: Dict[str, float] = {}  # Fim da janela do último 429, por chat
 
 # --- Helpers ---
 def format_tags_text(tags):
     if not tags: return ""
     return ", ".join([f"{t['tag']}:{t['value']}" if t['value'] else t['tag'] for t in tags[:4]])
 
+def ai_content_key(problem, host, tags):
+    tag_set = sorted(f"{t['tag']}:{t['value']}" for t in tags or [])
+    return hashlib.blake2b(f"{problem}|{host}|{tag_set}".encode(), digest_size=16).hexdigest()
+
 # --- Integrações ---
 async def send_telegram_alert(host, problem, severity, ai_summary, ai_action, tags):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID: return
-    await asyncio.sleep(random.uniform(0.5, 1.5))
     
-    sev_icon = {'Info': 'ℹ️', 'Aviso': '⚠️', 'Média': '🟠', 'Alta': '🔥', 'Crítica': '☠️'}.get(severity, '❓')
-    tag_list = [f"#{t['tag']}:{t['value']}" if t['value'] else f"#{t['tag']}" for t in tags[:3]]
-    tag_str = " ".join(tag_list)
-    
-    html_text = f"<b>{sev_icon} {severity.upper()} | {host}</b>\n<code>{problem}</code>\n\n🤖 <b>Análise IA:</b>\n{ai_summary}\n\n🚀 <b>Ação:</b>\n<pre>{ai_action}</pre>\n<span class=\"tg-spoiler\">{tag_str}</span>"
+    html_text = _TG_TEMPLATE.format_map({
+        "icon": _SEV_ICONS.get(severity, '❓'), "sev": severity.upper(), "host": host, "problem": problem,
+        "summary": ai_summary, "action": ai_action,
+        "tags": " ".join(f"#{t['tag']}:{t['value']}" if t['value'] else f"#{t['tag']}" for t in tags[:3])
+    })
     
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {"chat_id": TELEGRAM_CHAT_ID, "text": html_text, "parse_mode": "HTML"}
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as resp:
-                if resp.status != 200: logger.error(f"Telegram Erro: {await resp.text()}")
-    except: pass
+    clock = asyncio.get_running_loop().time
+    for _ in range(3):
+        async with tg_limiter, tg_chat_limiters[TELEGRAM_CHAT_ID]:
+            # Checa a janela do último 429 só depois de obter os limiters: quem
+            # estava na fila quando o 429 chegou também precisa esperar
+            wait = tg_retry_until.get(TELEGRAM_CHAT_ID, 0) - clock()
+            if wait > 0: await asyncio.sleep(wait)
+            async with app.state.http.post(url, json=payload) as resp:
+                if resp.status != 429:
+                    if resp.status != 200: logger.error(f"Telegram Erro: {await resp.text()}")
+                    return
+                retry_after = (await resp.json()).get('parameters', {}).get('retry_after', 1)
+        tg_retry_until[TELEGRAM_CHAT_ID] = max(tg_retry_until.get(TELEGRAM_CHAT_ID, 0), clock() + retry_after)
+        logger.warning(f"Telegram 429: chat bloqueado por {retry_after}s")
+    raise RuntimeError(f"Telegram 429: limite excedido para o chat {TELEGRAM_CHAT_ID}")
 
 async def get_zabbix_token():
     payload = {"jsonrpc": "2.0", "method": "user.login", "params": {"username": ZABBIX_USER, "password": ZABBIX_PASSWORD}, "id": 1}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{ZABBIX_URL}/api_jsonrpc.php", json=payload) as resp:
-                data = await resp.json()
-                return data.get('result')
+        async with app.state.http.post(f"{ZABBIX_URL}/api_jsonrpc.php", json=payload) as resp:
+            data = await resp.json()
+            return data.get('result')
     except: return None
 
 async def post_zabbix_comment(event_id, message):
-    if not zabbix_auth_token: return False
-    payload = {"jsonrpc": "2.0", "method": "event.acknowledge", "params": {"eventids": event_id, "action": 4, "message": message}, "auth": zabbix_auth_token, "id": 99}
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{ZABBIX_URL}/api_jsonrpc.php", json=payload) as resp:
-                await resp.json()
-                return True
-    except: return False
+    # Enfileira o ack; ele segue no mesmo lote JSON-RPC do próximo trigger.get
+    await zabbix_ack_queue.put((event_id, message))
+    return True
+
+def drain_ack_queue():
+    acks = []
+    while not zabbix_ack_queue.empty(): acks.append(zabbix_ack_queue.get_nowait())
+    return acks
+
+def is_auth_error(error):
+    if not isinstance(error, dict): return False
+    text = f"{error.get('message', '')} {error.get('data', '')}".lower()
+    return any(k in text for k in ("re-login", "not authori", "session terminated", "authentication"))
+
+def requeue_acks(acks):
+    for ack in acks: zabbix_ack_queue.put_nowait(ack)
 
 # --- IA ---
-async def analyze_with_ai(problem_name, host_name, tags):
+async def analyze_with_ai(problem_name, host_name, tags, on_analysis=None):
     global total_tokens_used
     context = format_tags_text(tags)
     prompt = f"Contexto: {context}\nErro: {problem_name}\nHost: {host_name}\nResponda JSON:\n{{\"analysis\": \"Causa (max 20 palavras)\", \"command\": \"Comando Linux ou 'Verificar logs'\"}}"
     try:
-        response = await aclient.chat.completions.create(
+        stream = await aclient.chat.completions.create(
             model=OPENAI_MODEL,
             messages=[{"role": "user", "content": prompt}],
             max_tokens=100,
             temperature=0.1,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
         )
-        if response.usage: total_tokens_used += response.usage.total_tokens
-        return json.loads(response.choices[0].message.content)
+        content = ""
+        async for chunk in stream:
+            if chunk.usage: total_tokens_used += chunk.usage.total_tokens
+            if not chunk.choices or not chunk.choices[0].delta.content: continue
+            content += chunk.choices[0].delta.content
+            # Entrega a causa assim que o campo "analysis" fecha, antes do fim da resposta
+            if on_analysis:
+                m = _AI_ANALYSIS_RE.search(content)
+                if m:
+                    on_analysis(orjson.loads(f'"{m.group(1)}"'))
+                    on_analysis = None
+        return orjson.loads(content)
     except: return {"analysis": "Erro IA", "command": "N/A"}
 
 async def run_ai_pipeline(event_id, problem, host, severity, tags):
+    await ai_admission.acquire()
     try:
-        logger.info(f"🧠 Analisando: {problem}")
-        ai_data = await analyze_with_ai(problem, host, tags)
+        key = ai_content_key(problem, host, tags)
+        ai_data = ai_result_cache.get(key)
+        if ai_data is None:
+            logger.info(f"🧠 Analisando: {problem}")
+            def show_partial(summary): ai_memory_cache[event_id] = {"summary": summary, "action": None}
+            ai_data = await analyze_with_ai(problem, host, tags, on_analysis=show_partial)
+            if ai_data.get("analysis") != "Erro IA": ai_result_cache[key] = ai_data
+        else:
+            logger.info(f"♻️ Cache IA: {problem}")
         summary = ai_data.get("analysis", "Indisponível")
         action = ai_data.get("command", "N/A")
         
         zabbix_msg = f"IA: {summary} | CMD: {action}"
         ai_memory_cache[event_id] = {"summary": summary, "action": action}
         
-        await post_zabbix_comment(event_id, zabbix_msg)
-        sev_map = {'1':'Info', '2':'Aviso', '3':'Média', '4':'Alta', '5':'Crítica'}
-        await send_telegram_alert(host, problem, sev_map.get(str(severity), 'Erro'), summary, action, tags)
+        # Zabbix e Telegram são independentes: disparo em paralelo
+        results = await asyncio.gather(
+            post_zabbix_comment(event_id, zabbix_msg),
+            send_telegram_alert(host, problem, _SEV_MAP.get(str(severity), 'Erro'), summary, action, tags),
+            return_exceptions=True
+        )
+        for name, result in zip(("Zabbix", "Telegram"), results):
+            if isinstance(result, Exception): logger.error(f"Pipeline {name}: {result}")
     except Exception as e: logger.error(f"Pipeline: {e}")
     finally:
-        if event_id in processing_events: processing_events.remove(event_id)
+        processing_events.discard(event_id)
+        await ai_admission.release()
 
 async def process_queue(triggers):
     global processing_events, handled_events
+    # Mantém só as análises dos eventos ativos e nunca limita abaixo desse total,
+    # senão o refill pelos acks despeja outra linha ativa a cada poll
+    active = {t.get('lastEvent', {}).get('eventid') for t in triggers}
+    ai_memory_cache.retain(active)
+    ai_memory_cache.maxsize = max(512, len(active))
     for t in triggers:
         ev = t.get('lastEvent', {})
         eid = ev.get('eventid')
-        if not eid or eid in processing_events or eid in handled_events: continue
-        if eid in ai_memory_cache: continue
+        if not eid or eid in ai_memory_cache or eid in processing_events: continue
+        # Já tratado mas fora do cache LRU: só recupera a análise pelos acks, sem novo pipeline
+        handled = eid in handled_events
 
         has_ack = False
         for ack in ev.get('acknowledges', []):
-            if "IA:" in ack.get('message', ''):
+            msg = ack.get('message')
+            if not msg or not msg.startswith('IA:'): continue
+            m = _ACK_RE.match(msg)
+            if m:
                 has_ack = True
-                try:
-                    parts = ack['message'].split('| CMD:')
-                    ai_memory_cache[eid] = {"summary": parts[0].replace('IA:', '').strip(), "action": parts[1].strip() if len(parts) > 1 else "N/A"}
-                except: pass
+                ai_memory_cache[eid] = {"summary": m.group(1), "action": m.group(2) or "N/A"}
                 break
         
-        if not has_ack:
+        if not has_ack and not handled:
             processing_events.add(eid)
             handled_events.add(eid)
             asyncio.create_task(run_ai_pipeline(eid, t['description'], t['hosts'][0]['name'], t['priority'], t.get('tags', [])))
@@ -167,7 +301,7 @@ async def fetch_data():
     global zabbix_auth_token
     if not zabbix_auth_token:
         zabbix_auth_token = await get_zabbix_token()
-        if not zabbix_auth_token: return []
+        if not zabbix_auth_token: return None
 
     payload = {
         "jsonrpc": "2.0", "method": "trigger.get",
@@ -178,49 +312,128 @@ async def fetch_data():
         },
         "auth": zabbix_auth_token, "id": 2
     }
+    acks = drain_ack_queue()
+    batch = [payload] + [
+        {"jsonrpc": "2.0", "method": "event.acknowledge", "params": {"eventids": eid, "action": 4, "message": msg}, "auth": zabbix_auth_token, "id": 100 + i}
+        for i, (eid, msg) in enumerate(acks)
+    ]
+    # Só reenfileira os acks se o POST não chegou / a resposta não decodificou
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{ZABBIX_URL}/api_jsonrpc.php", json=payload) as resp:
-                data = await resp.json()
-                if 'error' in data: 
-                    zabbix_auth_token = None
-                    return []
-                triggers = data.get('result', [])
-                await process_queue(triggers)
-                return triggers
-    except: return []
-
-def format_dashboard(triggers):
-    if not triggers: return None
+        async with app.state.http.post(f"{ZABBIX_URL}/api_jsonrpc.php", json=batch) as resp:
+            data = await resp.json()
+    except:
+        requeue_acks(acks)
+        return None
+    if isinstance(data, list):
+        results = {r.get('id'): r for r in data if isinstance(r, dict)}
+        trig = results.get(2) or {}
+    else:
+        # Lote rejeitado inteiro: um único objeto de erro, sem resultado por ack
+        results, trig = {}, data if isinstance(data, dict) else {}
+    failed_acks = []
+    for i, ack in enumerate(acks):
+        res = results.get(100 + i)
+        if res is None or 'error' in res:
+            if res: logger.error(f"Zabbix Ack {ack[0]}: {res['error']}")
+            failed_acks.append(ack)
+    requeue_acks(failed_acks)
+    if 'error' in trig: 
+        logger.error(f"Zabbix trigger.get: {trig['error']}")
+        if is_auth_error(trig['error']): zabbix_auth_token = None
+        return None
+    triggers = trig.get('result', [])
+    try: await process_queue(triggers)
+    except Exception as e: logger.error(f"Fila IA: {e}")
+    return triggers
+
+_time_cache = LRUCache(1440)  # "HH:MM" por minuto de lastchange
+
+def format_time(lastchange):
+    minute = int(lastchange) // 60
+    hhmm = _time_cache.get(minute)
+    if hhmm is None:
+        hhmm = datetime.fromtimestamp(minute * 60).strftime('%H:%M')
+        _time_cache[minute] = hhmm
+    return hhmm
+
+_MISSING = object()
+_row_cache = LRUCache(4096)  # id -> (assinatura, linha formatada)
+
+def format_dashboard(triggers, ai_state, proc_state):
     formatted = []
-    stats = {"total": 0, "critical": 0, "tokens": total_tokens_used}
+    append = formatted.append
+    _ai_get, _proc = ai_state.get, proc_state
+    _row_get = _row_cache.get
+    critical = 0
     for t in triggers:
-        stats["total"] += 1
-        if t['priority'] in ['4', '5']: stats["critical"] += 1
+        if t['priority'] in ('4', '5'): critical += 1
         eid = t.get('lastEvent', {}).get('eventid')
-        summary = ai_memory_cache.get(eid, {}).get('summary', "Aguardando...") if eid in ai_memory_cache else ("⚡ Processando..." if eid in processing_events else "Aguardando...")
-        action = ai_memory_cache.get(eid, {}).get('action')
-        frontend_tags = [f"{tag['tag']}: {tag['value']}" if tag['value'] else tag['tag'] for tag in t.get('tags', [])[:4]]
-        formatted.append({
-            "id": eid or t['triggerid'], "host": t['hosts'][0]['name'] if t['hosts'] else "?",
+        row_id = eid or t['triggerid']
+        entry = _ai_get(eid, _MISSING)
+        state = entry if entry is not _MISSING else (eid in _proc)
+        # Reaproveita a linha se nada relevante mudou desde o último poll
+        host = t['hosts'][0]['name'] if t['hosts'] else "?"
+        tags = t.get('tags', [])[:4]
+        sig = (t['lastchange'], t['description'], t['priority'], host, tuple((tag['tag'], tag['value']) for tag in tags), state)
+        cached = _row_get(row_id)
+        if cached and cached[0] == sig:
+            append(cached[1])
+            continue
+        if entry is not _MISSING:
+            summary, action = entry['summary'], entry['action']
+        else:
+            summary, action = ("⚡ Processando..." if state else "Aguardando..."), None
+        frontend_tags = [f"{tag['tag']}: {tag['value']}" if tag['value'] else tag['tag'] for tag in tags]
+        row = {
+            "id": row_id, "host": host,
             "problem": t['description'], "severity": t['priority'],
-            "time": datetime.fromtimestamp(int(t['lastchange'])).strftime('%H:%M'),
+            "time": format_time(t['lastchange']),
             "tags": frontend_tags, "ai_summary": summary, "ai_action": action
-        })
+        }
+        _row_cache[row_id] = (sig, row)
+        append(row)
+    stats = {"total": len(formatted), "critical": critical, "tokens": total_tokens_used}
     return {"stats": stats, "data": formatted}
 
+def build_dashboard_message(triggers, ai_state, proc_state):
+    return manager.diff(format_dashboard(triggers, ai_state, proc_state))
+
 async def loop():
     logger.info("🚀 AIOPS v9 (Fixed Syntax) Iniciado")
+    last_sig, idle_ticks = None, 0
     while True:
+        interval = POLL_MIN_INTERVAL
         try:
             raw = await fetch_data()
-            dash = format_dashboard(raw)
-            if dash: await manager.broadcast(json.dumps(dash))
+            # None = erro no fetch: mantém o painel atual; lista vazia limpa o painel
+            if raw is not None:
+                # Formatação + serialização + hash rodam fora do event loop, sobre
+                # cópias do estado de IA (os caches compartilhados ficam só no event loop)
+                message = await asyncio.to_thread(build_dashboard_message, raw, ai_memory_cache.snapshot(), processing_events.snapshot())
+                if message: await manager.broadcast(message)
+                # Polling adaptativo: backoff exponencial enquanto nada muda
+                sig = hash(tuple((t.get('lastEvent', {}).get('eventid'), t['lastchange']) for t in raw))
+                busy = len(processing_events) or not zabbix_ack_queue.empty()
+                if sig == last_sig and not busy:
+                    idle_ticks = min(idle_ticks + 1, 5)
+                    interval = min(POLL_MAX_INTERVAL, 2 ** idle_ticks)
+                else:
+                    idle_ticks = 0
+                last_sig = sig
         except Exception as e: logger.error(f"Loop: {e}")
-        await asyncio.sleep(4)
+        await asyncio.sleep(interval)
 
 @app.on_event("startup")
-async def startup(): asyncio.create_task(loop())
+async def startup():
+    # Sessão HTTP única (keep-alive + pool) compartilhada por Zabbix e Telegram
+    app.state.http = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=15),
+        connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=60)
+    )
+    asyncio.create_task(loop())
+
+@app.on_event("shutdown")
+async def shutdown(): await app.state.http.close()
 
 # --- ROTAS ---
 
@@ -249,6 +462,17 @@ async def dashboard(request: Request):
         return RedirectResponse(url="/login")
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.post("/admin/ai-concurrency")
+async def set_ai_concurrency(request: Request, limit: int = Form(...)):
+    token = request.cookies.get("access_token")
+    if not token or token != "authorized":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    if limit < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="limit deve ser >= 1")
+    await ai_admission.resize(limit)
+    logger.info(f"⚙️ Concorrência IA: {limit}")
+    return {"ai_max_concurrency": limit}
+
 @app.websocket("/ws")
 async def ws(websocket: WebSocket):
     token = websocket.cookies.get("access_token")